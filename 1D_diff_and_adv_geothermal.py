@@ -1,41 +1,81 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
+from numba import njit, prange
 
 
 ## ------------------------------- IMPORT DATA --------------------------------##
-data = pd.read_csv('geothermal_well_data.csv')
+## the first line of the .csv is the citation, the column names are on the second
+data = pd.read_csv('geothermal_well_data.csv', skiprows=1,
+                   usecols=['Type', 'Injection Rate (t/h)', 'Injection Temperature'],
+                   dtype={'Injection Rate (t/h)': np.float64, 'Injection Temperature': np.float64})
 
 ## create arrays based on columns in .csv
-reinjection_rates = np.array(data.iloc[1:, 4]) ## reinjection rate of geothermal fluid in tonne/hr
-temperatures = np.array(data.iloc[1:, 5]) ## reinjection temperature of geothermal fluid in *C
-reservoirs = data.iloc[1:, 2].values ## type of reservoir: hot water, 2-phase low enthalpy, 2-phase medium enthalpy, 2-phase high enthalpy
+reinjection_rates = data['Injection Rate (t/h)'].to_numpy() ## reinjection rate of geothermal fluid in tonne/hr
+temperatures = data['Injection Temperature'].to_numpy() ## reinjection temperature of geothermal fluid in *C
+reservoirs = data['Type'].to_numpy() ## type of reservoir: hot water, 2-phase low enthalpy, 2-phase medium enthalpy, 2-phase high enthalpy
 
-def geothermal_model(reinjection_rate, temperature):
+## ---------------------- INITIAL CONDITIONS ------------------------------##
+## grid and initial gradient are the same for every well, so they are built once
+dz = 10 ## meter steps between nodes
+z = np.arange(1000, 1500, dz) ## depths 
+nodes = len(z)
+## the model runs in single precision, which is well within plotting resolution
+T_init = np.linspace(150, 250, num=nodes, dtype=np.float32)  ## fills in the array with temps in *C
+
+## ----------------------- MODEL PARAMETERS -------------------------------## 
+p = 1.00 ## density of geothermal fluid (g/cm3)
+cT = 4.186 ## specific heat of geothermal fluid (unit)
+D = 0.6 ## thermal conductivity of geothermal fluid
+dt = 0.1 ## time step
+totaltime = 10 ## changing total time can result in model instability
+nsteps = int(round(totaltime/dt)) + 1 ## same step count as stepping while time <= totaltime
+
+## ------- VARIABLES FOR THE STENCIL AND STABILITY CHECK (velocity free) -------##
+s = (dt*D)/(dz**2*p*cT)
+vn = (dt*D)/(dz**2) ## von neuman coefficient for stability
+
+## -------------------------- TIME STEPPING KERNEL ---------------------------##
+## compiled with numba so the whole time loop runs without python overhead
+## steps a single well, ping-ponging between the T and Tnew buffers
+## nodes and nsteps are read as globals so numba compiles fixed loop counts; rows must have nodes entries
+@njit(cache=True, fastmath=True)
+def _step_1d(T, Tnew, a, b0, c1, d, S):
+    for k in range(nsteps):
+        for i in range(2, nodes-1):
+            Tnew[i] = a*T[i+1] + b0*T[i] + c1*T[i-1] + d*T[i-2]
+        Tnew[0] = T[0]
+        Tnew[1] = S
+        Tnew[2] = S
+        Tnew[-1] = T[-1]
+        T, Tnew = Tnew, T ## swap buffers instead of copying back
+    return T
+
+## wells are independent, so they are spread across cores with prange
+## T holds one row per well, a, b0, c1, d and S hold one value per well
+@njit(cache=True, parallel=True)
+def _step_loop(T, a, b0, c1, d, S):
+    if T.shape[1] != nodes:
+        raise ValueError('rows must have nodes entries')
+    Tnew = np.empty_like(T) ## second buffer, allocated once per call
+    for w in prange(T.shape[0]):
+        ## result may sit in either buffer after the last swap
+        T[w] = _step_1d(T[w], Tnew[w], a[w], b0[w], c1[w], d[w], S[w])
+    return T
+
+def geothermal_model(reinjection_rates, temperatures):
+    ## Runs every well at once -- returns one temperature profile per stable well
+    ## and a mask of which wells passed the stability check
+    
     ## Convert reinjection rate to velocity -- Q = vA or v = Q/A
     ## Q = t/hr or m3/hr -> convert to m3/s
     ## A = average are of reinjection well head (0.5m2)       
     
-    velocity = float(reinjection_rate)/60/60/0.5 ## change to float for numeric operations
+    velocities = reinjection_rates/60/60/0.5
     
     
-    ## ---------------------- INITIAL CONDITIONS ------------------------------##
-    dz = 10 ## meter steps between nodes
-    z = np.arange(1000, 1500, dz) ## depths 
-    nodes = len(z)
-    T = np.linspace(150, 250, num=nodes)  ## fills in the array with temps in *C
-         
-    ## ----------------------- MODEL PARAMETERS -------------------------------## 
-    u = velocity  ## m/s 
-    p = 1.00 ## density of geothermal fluid (g/cm3)
-    cT = 4.186 ## specific heat of geothermal fluid (unit)
-    D = 0.6 ## thermal conductivity of geothermal fluid
-    dt = 0.1 ## time step
-    
-    ## -------- DEFINING VARIABLES FOR A MATRIX AND STABILITY CHECK -----------##
-    s = (dt*D)/(dz**2*p*cT)
-    vn = (dt*D)/(dz**2) ## von neuman coefficient for stability
-    c = dt*(u/dz)
+    u = velocities  ## m/s 
+    c = dt*(u/dz) ## courant number, the only coefficient that depends on the well
     
     """
     --------------------------- STABILITY CHECK  ------------------------------
@@ -44,81 +84,84 @@ def geothermal_model(reinjection_rate, temperature):
     (1) Courant^2 <= 2*vn
     (2) vn + courant/4 <=0.5
     
-    if stability check fails, model will not return a result
+    if stability check fails, the well is dropped from the result
+    
+    (1) binds and is a combined advection-diffusion limit (dt <= 2*D/u**2),
+    so an implicit diffusion solve would not allow a larger dt
     """
     
-    if c**2 > 2*vn:
-        print('unstable #1:', c**2, '>', 2*s)
-        return None
-    if vn + c/4 > 0.5:
-        print('unstable #2:', s+c/4, ">", 0.5)
-        return None
+    stable = (c**2 <= 2*vn) & (vn + c/4 <= 0.5)
+    for ci in c[~stable]:
+        if ci**2 > 2*vn:
+            print('unstable #1:', ci**2, '>', 2*s)
+        else:
+            print('unstable #2:', s+ci/4, ">", 0.5)
+    c = c[stable].astype(np.float32)
+    s32 = np.float32(s)
 
     
-    ## ----------- BUILDING THE 1D DIFFUSION + ADVECTION A MATRIX -------------##
-    A = np.zeros((nodes, nodes))
-    for i in range(2, nodes-1):
-       A[i, i+1] = s-(3/8*c)
-       A[i,i] = 1-(2*s)-(3/8*c)
-       A[i, i-1] = s+(7/8*c)
-       A[i, i-2] = -1/8*c
-    A[0,0] = 1
-    A[1,1] = 1
-    A[-1,-1] = 1    
+    ## ------------ STENCIL COEFFICIENTS FOR DIFFUSION + ADVECTION ------------##
+    ## each interior node only depends on T[i+1], T[i], T[i-1] and T[i-2],
+    ## so the update is applied as a 4-point stencil instead of a dense matrix
+    a = s32-(3/8*c)           ## coefficient on T[i+1]
+    b0 = 1-(2*s32)-(3/8*c)    ## coefficient on T[i]
+    c1 = s32+(7/8*c)          ## coefficient on T[i-1]
+    d = -1/8*c                ## coefficient on T[i-2]
      
     
-    ## Creates an iterative temperature variable within the function, turned into a float 
-    S = float(temperature)    
+    ## Injection temperature of every stable well 
+    S = temperatures[stable].astype(np.float32)    
    
     ## --------------------- MODELING THROUGH TIME ----------------------------##
-    time = 0
-    totaltime = 10 ## changing total time can result in model instability
-    while time <= totaltime:
-        new_T = np.dot(A, T)
-        T[:] = new_T*1
-        T[1:3] = S
-        time += dt 
+    T = np.tile(T_init, (c.size, 1)) ## one copy of the initial gradient per well
+    ## T[:, 0] and T[:, -1] are fixed boundaries and are left untouched
+    T = _step_loop(T, a, b0, c1, d, S)
     
-    return T, z
+    return T, z, stable
 
 ##----------------------------- PLOTTING SET UP -------------------------------##
 
 ## Initial Conditions
-dzi = 10 ## meter steps between nodes
-zi = np.arange(1000, 1500, dzi) ## depths 
-nodesi = len(zi)
-Ti = np.linspace(150, 250, num=nodesi)  ## fills in the array with temps in *C
+zi = z ## depths 
+Ti = T_init ## initial temperature gradient in *C
 
 
 # Plotting
 fig, ax = plt.subplots(2, 2, sharex=True, sharey=True)
 axs = ax.flatten()
 
+## which subplot each reservoir type is drawn on
+reservoir_to_ax = {'Hot Water': 0,
+                   '2-Phase, Low E': 1,
+                   '2-Phase, Med E': 2,
+                   '2-Phase, High E': 3}
+
+
+## initial gradient, drawn once on each subplot for reference
+for i in range(len(axs)):
+    axs[i].plot(Ti, zi, '--k', label='Initial')
 
 ## --------------------------- PLOT THE FUNCTION ------------------------------##
 
 ## using a for loop, which correlates each reinjection rate to its reservoir type 
-for reinjection_rate, reservoir, temperature in zip(reinjection_rates, reservoirs, temperatures):
-    output = geothermal_model(reinjection_rate, temperature)
+T_all, z, stable = geothermal_model(reinjection_rates, temperatures)
+for T, reservoir, temperature in zip(T_all, reservoirs[stable], temperatures[stable]):
+    i = reservoir_to_ax.get(reservoir)
+    if i is None: ## reservoir type without a subplot
+        continue
     
-    if output is not None:    
-        T, z = output
-        if reservoir == 'Hot Water':
-            i = 0
-        elif reservoir == "2-Phase, Low E":
-            i = 1
-        elif reservoir == "2-Phase, Med E": 
-            i = 2
-        elif reservoir == "2-Phase, High E":
-            i = 3
-        
-        axs[i].plot(T, z, label=f'Injection Temp: {temperature}°C')
-        axs[i].plot(Ti, zi, '--k')
-        axs[i].set_title(f'Temperature Change - {reservoir} System')
-        axs[i].set_xlabel('Temperature (°C)', fontsize = 14)
-        axs[i].set_ylabel('Depth (m)', fontsize = 14)
-        axs[i].invert_yaxis()
-        axs[i].legend()
+    axs[i].plot(T, z, label=f'Injection Temp: {temperature:g}°C')
+
+## titles, labels and legends only need setting once per subplot
+for reservoir, i in reservoir_to_ax.items():
+    axs[i].set_title(f'Temperature Change - {reservoir} System')
+    axs[i].set_xlabel('Temperature (°C)', fontsize = 14)
+    axs[i].set_ylabel('Depth (m)', fontsize = 14)
+    axs[i].legend()
+
+## the subplots share a y axis, so a single call flips depth on all of them
+## (invert_yaxis toggles, calling it once per well made the result depend on the well count)
+axs[0].invert_yaxis()
 
 
 plt.suptitle('Impact of Reinjection Fluid on Geothermal Reservoir Temperature Change Across Multiple Reservoir Types', fontsize = 20)